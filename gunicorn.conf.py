@@ -0,0 +1,13 @@
+import os
+
+# Gunicorn settings; `gunicorn server:app` picks this file up automatically.
+# Game state lives in process memory, so run a single worker and serve
+# concurrent requests from a thread pool.
+bind = "127.0.0.1:5001"
+workers = 1
+worker_class = "gthread"
+# Every open /events stream holds one thread for as long as the page is open,
+# so the pool has to cover one thread per connected tab plus headroom for
+# ordinary requests. With the default 64, about 56 tabs can be connected
+# before other requests start to queue; raise GUNICORN_THREADS for more.
+threads = int(os.getenv("GUNICORN_THREADS", "64"))
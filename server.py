@@ -1,79 +1,287 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template, session
 import random
+import asyncio
+import array
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import itertools
-import json
+import numpy as np
+import orjson
 import threading
 import queue
 import os
+import time
+import uuid
+from collections import Counter, deque
+from functools import reduce
+from operator import or_
 
 # --- Gemini API Setup ---
 # IMPORTANT: Set your GOOGLE_API_KEY as an environment variable
 # For example: export GOOGLE_API_KEY="YOUR_API_KEY"
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+
+# Rules that never change between turns; sent once as the system instruction
+# so each request only carries the current game state.
+GEMINI_SYSTEM_INSTRUCTION = """
+You are a professional Texas Hold'em poker player. Analyze the game state and output your best action in JSON format.
+
+Your possible actions:
+- `fold`: Forfeit the round.
+- `check`: Bet nothing (only if no call is required).
+- `call`: Match the current bet.
+- `raise`: Increase the bet. Specify the total amount in the `amount` field, at least the minimum raise given in the game state.
+- `all-in`: Bet all your remaining chips.
+
+Respond with your action and, for a raise, the total amount.
+"""
+
 if GOOGLE_API_KEY:
     genai.configure(api_key=GOOGLE_API_KEY)
-    model = genai.GenerativeModel('gemini-2.5-flash') # Updated model
+    model = genai.GenerativeModel('gemini-2.5-flash', system_instruction=GEMINI_SYSTEM_INSTRUCTION) # Updated model
 else:
     print("Warning: GOOGLE_API_KEY is not set. Gemini player will be disabled.")
     model = None
 
+# Structured output: Gemini returns exactly this JSON shape
+GEMINI_ACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "action": {"type": "string", "enum": ["fold", "check", "call", "raise", "all-in"]},
+        "amount": {"type": "integer"},
+    },
+    "required": ["action"],
+}
+GEMINI_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": GEMINI_ACTION_SCHEMA,
+}
+
+# All Gemini requests run on one background event loop, so they share the
+# async client's connection instead of setting up a new one per turn.
+gemini_loop = asyncio.new_event_loop()
+threading.Thread(target=gemini_loop.run_forever, daemon=True).start()
+
+def run_gemini(coro):
+    return asyncio.run_coroutine_threadsafe(coro, gemini_loop)
+
+# Bound how long one Gemini turn can stall the game thread
+GEMINI_TIMEOUT = 8 # seconds per request
+GEMINI_RETRIES = 1
+GEMINI_RETRY_ERRORS = (google_exceptions.DeadlineExceeded, google_exceptions.ServiceUnavailable, asyncio.TimeoutError)
+
+async def ask_gemini(prompt):
+    for attempt in range(GEMINI_RETRIES + 1):
+        try:
+            response = await model.generate_content_async(
+                prompt,
+                generation_config=GEMINI_GENERATION_CONFIG,
+                request_options={"timeout": GEMINI_TIMEOUT}
+            )
+            break
+        except GEMINI_RETRY_ERRORS:
+            if attempt == GEMINI_RETRIES:
+                raise
+            await asyncio.sleep(0.5 * 2 ** attempt) # Exponential backoff
+    action_data = orjson.loads(response.text)
+    return action_data.get("action", "fold"), action_data.get("amount", 0)
+
+if model:
+    # Warm up the connection so the first Gemini turn doesn't pay for the handshake
+    run_gemini(model.count_tokens_async("ping"))
+
 # --- Core Game Logic (from poker_gui.py, adapted for web) ---
 
 SUITS = ['♠', '♥', '♦', '♣']
 RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K', 'A']
 RANK_VALUES = {'2': 2, '3': 3, '4': 4, '5': 5, '6': 6, '7': 7, '8': 8, '9': 9, '10': 10, 'J': 11, 'Q': 12, 'K': 13, 'A': 14}
 
+# --- Hand Evaluation Tables (Cactus Kev style) ---
+# Each card is packed into a 32-bit int:
+#   xxxbbbbb bbbbbbbb cdhsrrrr xxpppppp
+# b = rank bit, cdhs = suit bit, r = rank index (0-12), p = rank prime.
+# A 5-card hand is then looked up either by the OR of its rank bits (flush)
+# or by the product of its rank primes (everything else). Scores run from
+# 1 (royal flush) to 7462 (7-5-4-3-2 offsuit); lower is better.
+
+RANK_PRIMES = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+SUIT_BITS = {'♠': 0x1000, '♥': 0x2000, '♦': 0x4000, '♣': 0x8000}
+CARD_INT = {
+    (s, r): (1 << (16 + i)) | SUIT_BITS[s] | (i << 8) | RANK_PRIMES[i]
+    for s in SUITS for i, r in enumerate(RANKS)
+}
+
+HAND_NAMES = ["High Card", "One Pair", "Two Pair", "Three of a Kind", "Straight", "Flush", "Full House", "Four of a Kind", "Straight Flush", "Royal Flush"]
+
+# Rank bitmasks (bit 0 = deuce) of the ten straights, A-high down to the wheel
+WHEEL_MASK = 0b1000000001111
+STRAIGHT_MASKS = {0b1111100000000 >> i for i in range(9)} | {WHEEL_MASK}
+
+def _rank_mask(values):
+    return reduce(or_, (1 << (v - 2) for v in values))
+
+def _hand_class_key(values, is_flush):
+    # Orders rank patterns by strength: (category, tie-break values)
+    values = sorted(values, reverse=True)
+    rank_mask = _rank_mask(values)
+    if rank_mask in STRAIGHT_MASKS:
+        high = 5 if rank_mask == WHEEL_MASK else values[0]
+        return (8, [high]) if is_flush else (4, [high])
+    if is_flush: return (5, values)
+    # values is already descending, so ties in count keep the higher rank first
+    counts = Counter(values).most_common()
+    kickers = [v for v, _ in counts]
+    if counts[0][1] == 4: return (7, kickers)
+    if counts[0][1] == 3 and counts[1][1] == 2: return (6, kickers)
+    if counts[0][1] == 3: return (3, kickers)
+    if counts[0][1] == 2 and counts[1][1] == 2: return (2, kickers)
+    if counts[0][1] == 2: return (1, kickers)
+    return (0, kickers)
+
+def _build_hand_tables():
+    hands = []
+    for values in itertools.combinations_with_replacement(range(2, 15), 5):
+        if Counter(values).most_common(1)[0][1] > 4:
+            continue
+        prime_product = 1
+        for v in values:
+            prime_product *= RANK_PRIMES[v - 2]
+        hands.append((_hand_class_key(values, False), False, prime_product))
+        if values[0] < values[1] < values[2] < values[3] < values[4]:
+            hands.append((_hand_class_key(values, True), True, _rank_mask(values)))
+    hands.sort(key=lambda h: h[0], reverse=True)
+
+    flush_table, unsuited_table, categories = {}, {}, [None]
+    for score, (class_key, is_flush, lookup_key) in enumerate(hands, start=1):
+        (flush_table if is_flush else unsuited_table)[lookup_key] = score
+        categories.append(class_key[0])
+    categories[1] = 9 # Royal Flush
+    return flush_table, unsuited_table, categories
+
+FLUSH_TABLE, UNSUITED_TABLE, HAND_CATEGORIES = _build_hand_tables()
+
+# Array forms of the tables for batched evaluation: flushes index directly by
+# rank bits, prime products are found with a binary search over sorted keys.
+FLUSH_RANKS = np.zeros(1 << 13, dtype=np.int16)
+FLUSH_RANKS[list(FLUSH_TABLE)] = list(FLUSH_TABLE.values())
+UNSUITED_KEYS = np.array(sorted(UNSUITED_TABLE), dtype=np.int64)
+UNSUITED_RANKS = np.array([UNSUITED_TABLE[k] for k in UNSUITED_KEYS.tolist()], dtype=np.int16)
+COMBO_IDX = np.array(list(itertools.combinations(range(7), 5)), dtype=np.int8)
+
 class Card:
     def __init__(self, suit, rank):
         self.suit = suit
         self.rank = rank
         self.value = RANK_VALUES[rank]
+        self.code = CARD_INT[(suit, rank)]
+        # Cards are immutable, so the serialized forms are built once
+        self._dict = {"suit": suit, "rank": rank}
+        self._str = suit + rank
+
+    def __str__(self):
+        return self._str
 
     def to_dict(self):
-        return {"suit": self.suit, "rank": self.rank}
+        return self._dict
+
+# Only 52 cards ever exist; every Deck shares these instances
+ALL_CARDS = [Card(s, r) for s in SUITS for r in RANKS]
+CARD_IDS = array.array('B', range(len(ALL_CARDS)))
 
 class Deck:
     def __init__(self):
-        self.cards = [Card(s, r) for s in SUITS for r in RANKS]
+        # The deck is a permutation of card ids into ALL_CARDS
+        self.cards = CARD_IDS[:]
+        self.shuffle()
+
+    def reset(self):
+        # Refill and reshuffle in place so each round reuses the same array
+        self.cards[:] = CARD_IDS
         self.shuffle()
 
     def shuffle(self):
         random.shuffle(self.cards)
 
     def deal(self):
-        return self.cards.pop() if self.cards else None
+        return ALL_CARDS[self.cards.pop()] if self.cards else None
+
+class SeatField:
+    # A Player attribute stored in one of PokerGame's per-seat NumPy arrays
+    def __init__(self, array_name, cast):
+        self.array_name = array_name
+        self.cast = cast
+
+    def __get__(self, player, owner=None):
+        if player is None:
+            return self
+        return self.cast(getattr(player.table, self.array_name)[player.seat])
+
+    def __set__(self, player, value):
+        getattr(player.table, self.array_name)[player.seat] = value
 
 class Player:
-    def __init__(self, name, chips=1000, is_cpu=False, is_gemini=False):
+    # Numeric state lives in the table's arrays (structure of arrays);
+    # a Player is a view onto its seat.
+    chips = SeatField("chips", int)
+    bet = SeatField("bets", int)
+    has_acted = SeatField("acted", bool)
+    is_folded = SeatField("folded", bool)
+    is_all_in = SeatField("all_in", bool)
+
+    def __init__(self, table, seat, name, is_cpu=False, is_gemini=False):
+        self.table = table
+        self.seat = seat
         self.name = name
         self.hand = []
-        self.chips = chips
-        self.bet = 0
-        self.has_acted = False
-        self.is_folded = False
-        self.is_all_in = False
         self.is_cpu = is_cpu
         self.is_gemini = is_gemini
         self.show_hand = not is_cpu and not is_gemini
 
+    STATE_FIELDS = ("name", "hand", "chips", "bet", "has_acted", "is_folded", "is_all_in", "is_cpu", "is_gemini", "show_hand")
+
+    def snapshot(self):
+        # Plain tuple of STATE_FIELDS, cheap enough to take under action_lock
+        return (
+            self.name,
+            tuple(self.hand) if self.show_hand else (),
+            self.chips,
+            self.bet,
+            self.has_acted,
+            self.is_folded,
+            self.is_all_in,
+            self.is_cpu,
+            self.is_gemini,
+            self.show_hand
+        )
+
+    @staticmethod
+    def dict_from_snapshot(fields):
+        state = dict(zip(Player.STATE_FIELDS, fields))
+        state["hand"] = [c.to_dict() for c in state["hand"]]
+        return state
+
     def to_dict(self):
-        return {
-            "name": self.name,
-            "hand": [c.to_dict() for c in self.hand] if self.show_hand else [],
-            "chips": self.chips,
-            "bet": self.bet,
-            "has_acted": self.has_acted,
-            "is_folded": self.is_folded,
-            "is_all_in": self.is_all_in,
-            "is_cpu": self.is_cpu,
-            "is_gemini": self.is_gemini,
-            "show_hand": self.show_hand
-        }
+        return self.dict_from_snapshot(self.snapshot())
+
+# Console output is written by a daemon thread so that game code holding
+# action_lock never blocks on a slow stdout.
+_LOG_Q = queue.Queue()
+
+def _drain_log_queue():
+    while True:
+        print(_LOG_Q.get())
+
+threading.Thread(target=_drain_log_queue, daemon=True).start()
 
 class PokerGame:
     def __init__(self, human_player_name, cpu_players=0, gemini_players=0):
         self.players = []
+        # Per-seat player state, indexed by Player.seat
+        self.chips = np.zeros(0, dtype=np.int64)
+        self.bets = np.zeros(0, dtype=np.int64)
+        self.acted = np.zeros(0, dtype=np.bool_)
+        self.folded = np.zeros(0, dtype=np.bool_)
+        self.all_in = np.zeros(0, dtype=np.bool_)
         self.deck = Deck()
         self.community_cards = []
         self.pot = 0
@@ -85,9 +293,26 @@ class PokerGame:
         self.big_blind_index = -1
         self.small_blind_amount = 10
         self.big_blind_amount = 20
-        self.log_messages = []
+        self.log_messages = deque(maxlen=200)
         self.action_lock = threading.Lock()
         self.human_action_needed = False
+        # Wakes the game thread after a human action or a next-round request
+        self.action_event = threading.Event()
+        self.next_round_requested = False
+        self.stopped = False
+        self.last_active = time.monotonic() # Updated by requests for this game
+        # Betting counters kept up to date by handle_action, so process_turn
+        # can tell whether the street is over without scanning every player
+        self._active_count = 0
+        self._active_not_allin_count = 0
+        self._acted_count = 0
+        self._bet_counts = Counter() # bet -> number of active, not all-in players at it
+        # In-flight Gemini requests for this street: player -> (gemini_state_key() when asked, future)
+        self._gemini_pending = {}
+        # Serialized state is rebuilt only after something changes
+        self._state_version = 0
+        self.state_changed = threading.Condition()
+        self._state_cache = None
 
         self.add_player(human_player_name)
         for i in range(cpu_players):
@@ -96,23 +321,82 @@ class PokerGame:
             for i in range(gemini_players):
                 self.add_player(f"Gemini {i+1}", is_gemini=True)
 
-    def add_player(self, name, is_cpu=False, is_gemini=False):
-        self.players.append(Player(name, is_cpu=is_cpu, is_gemini=is_gemini))
+    def add_player(self, name, chips=1000, is_cpu=False, is_gemini=False):
+        self.chips = np.append(self.chips, chips)
+        self.bets = np.append(self.bets, 0)
+        self.acted = np.append(self.acted, False)
+        self.folded = np.append(self.folded, False)
+        self.all_in = np.append(self.all_in, False)
+        self.players.append(Player(self, len(self.players), name, is_cpu=is_cpu, is_gemini=is_gemini))
+
+    def remove_busted_players(self):
+        # This method should only be called from within a locked context
+        keep = self.chips > 0
+        self.players = [p for p, k in zip(self.players, keep) if k]
+        for seat, p in enumerate(self.players):
+            p.seat = seat
+        self.chips = self.chips[keep]
+        self.bets = self.bets[keep]
+        self.acted = self.acted[keep]
+        self.folded = self.folded[keep]
+        self.all_in = self.all_in[keep]
 
     def log(self, message):
-        print(message) # For server console
         self.log_messages.append(message)
+        _LOG_Q.put_nowait(message) # For server console
+        self._mark_state_changed()
+
+    def _mark_state_changed(self):
+        with self.state_changed:
+            self._state_version += 1
+            self.state_changed.notify_all()
+
+    def wait_for_change(self, seen_version, timeout=None):
+        # Blocks until the state moves past seen_version; returns the current version
+        with self.state_changed:
+            self.state_changed.wait_for(lambda: self._state_version != seen_version, timeout)
+            return self._state_version
 
     def get_state(self):
+        return self._cached_state()[1]
+
+    def get_state_json(self):
+        return self._cached_state()[2]
+
+    def _cached_state(self):
+        cache = self._state_cache
+        if cache is not None and cache[0] == self._state_version:
+            return cache
+        # Copy fields under the lock, build the dict and JSON outside it.
+        # The cache is tagged with the version it was copied at, so a change
+        # made after the copy makes the next reader rebuild.
+        with self.action_lock:
+            version = self._state_version
+            snapshot = self._snapshot_state()
+        state = self._build_state(snapshot)
+        cache = (version, state, orjson.dumps(state))
+        with self.state_changed:
+            # Another request may have built a newer state meanwhile
+            if self._state_cache is None or version >= self._state_cache[0]:
+                self._state_cache = cache
+            return self._state_cache
+
+    def _build_state(self, snapshot):
+        snapshot["players"] = [Player.dict_from_snapshot(fields) for fields in snapshot["players"]]
+        snapshot["community_cards"] = [c.to_dict() for c in snapshot["community_cards"]]
+        return snapshot
+
+    def _snapshot_state(self):
+        # This method should only be called from within a locked context
         return {
-            "players": [p.to_dict() for p in self.players],
-            "community_cards": [c.to_dict() for c in self.community_cards],
+            "players": tuple(p.snapshot() for p in self.players),
+            "community_cards": tuple(self.community_cards),
             "pot": self.pot,
             "current_bet": self.current_bet,
             "current_player_index": self.current_player_index,
             "game_stage": self.game_stage,
             "game_in_progress": self.game_in_progress,
-            "log": self.log_messages[-10:], # Return last 10 messages
+            "log": list(self.log_messages)[-10:], # Return last 10 messages
             "human_action_needed": self.human_action_needed
         }
 
@@ -126,30 +410,61 @@ class PokerGame:
             return
         self.game_in_progress = True
         self.small_blind_index = (self.small_blind_index + 1) % len(self.players)
-        self.start_round()
+        self.next_round_requested = True
+        self.action_event.set()
+        self.run_game_loop()
+
+    def run_game_loop(self):
+        # The one long-running game thread. CPU and Gemini turns run here;
+        # request handlers only record their input and set action_event.
+        while not self.stopped:
+            self.action_event.wait()
+            self.action_event.clear()
+            if self.stopped:
+                break
+            if self.next_round_requested:
+                self.start_round()
+            self.process_turn()
+
+    def stop(self):
+        self.stopped = True
+        with self.action_lock:
+            self.discard_gemini_actions()
+        self.action_event.set()
+
+    def request_next_round(self):
+        with self.action_lock:
+            if self.game_in_progress or self.next_round_requested:
+                return False
+            self.next_round_requested = True
+        self.action_event.set()
+        return True
 
     def start_round(self):
         with self.action_lock:
+            self._mark_state_changed()
+            self.discard_gemini_actions()
+            self.next_round_requested = False
             self.game_in_progress = True
-            self.deck = Deck()
+            self.deck.reset()
             self.community_cards = []
             self.pot = 0
             self.current_bet = 0
             self.game_stage = "pre-flop"
             self.log_messages.clear()
 
-            self.players = [p for p in self.players if p.chips > 0]
+            self.remove_busted_players()
             if len(self.players) < 2:
-                self.log("プレイ可能なプレイヤーが2人未満になりました。ゲームを終了します。")
                 self.game_in_progress = False
+                self.log("プレイ可能なプレイヤーが2人未満になりました。ゲームを終了します。")
                 return
 
+            self.bets[:] = 0
+            self.acted[:] = False
+            self.folded[:] = False
+            self.all_in[:] = False
             for player in self.players:
                 player.hand = [self.deck.deal(), self.deck.deal()]
-                player.bet = 0
-                player.has_acted = False
-                player.is_folded = False
-                player.is_all_in = False
                 player.show_hand = not player.is_cpu and not player.is_gemini
 
             self.small_blind_index = (self.small_blind_index + 1) % len(self.players)
@@ -171,23 +486,51 @@ class PokerGame:
             self.pot += sb_player.bet + bb_player.bet
             self.current_bet = self.big_blind_amount
             self.current_player_index = (self.big_blind_index + 1) % len(self.players)
-        
-        self.process_betting_round()
+            self._recount_betting_state()
 
-    def process_betting_round(self):
-        if self.game_stage != "pre-flop":
-            with self.action_lock:
-                self.current_player_index = (self.small_blind_index) % len(self.players)
-                while self.players[self.current_player_index].is_folded or self.players[self.current_player_index].is_all_in:
-                    self.current_player_index = (self.current_player_index + 1) % len(self.players)
+    def start_betting_round(self):
+        # This method should only be called from within a locked context
+        self.current_player_index = (self.small_blind_index) % len(self.players)
+        for _ in range(len(self.players)):
+            p = self.players[self.current_player_index]
+            if not p.is_folded and not p.is_all_in:
+                break
+            self.current_player_index = (self.current_player_index + 1) % len(self.players)
 
-                self.current_bet = 0
-                for p in self.players:
-                    p.bet = 0 # Bets are collected at end of round
-                    if not p.is_folded and not p.is_all_in:
-                        p.has_acted = False
-        
-        self.process_turn()
+        self.current_bet = 0
+        self.bets[:] = 0 # Bets are collected at end of round
+        self.acted[~(self.folded | self.all_in)] = False
+        self._recount_betting_state()
+        self._mark_state_changed()
+
+    def _recount_betting_state(self):
+        # This method should only be called from within a locked context
+        active = ~self.folded
+        active_not_allin = active & ~self.all_in
+        self._active_count = int(active.sum())
+        self._active_not_allin_count = int(active_not_allin.sum())
+        self._acted_count = int((self.acted & active_not_allin).sum())
+        self._bet_counts = Counter(self.bets[active_not_allin].tolist())
+
+    def _track_betting_state(self, p):
+        if p.is_folded:
+            return
+        self._active_count += 1
+        if not p.is_all_in:
+            self._active_not_allin_count += 1
+            self._acted_count += p.has_acted
+            self._bet_counts[p.bet] += 1
+
+    def _untrack_betting_state(self, p):
+        if p.is_folded:
+            return
+        self._active_count -= 1
+        if not p.is_all_in:
+            self._active_not_allin_count -= 1
+            self._acted_count -= p.has_acted
+            self._bet_counts[p.bet] -= 1
+            if not self._bet_counts[p.bet]:
+                del self._bet_counts[p.bet]
 
     def process_turn(self):
         while self.game_in_progress:
@@ -195,32 +538,31 @@ class PokerGame:
             is_human = False
 
             with self.action_lock:
-                active_players = [p for p in self.players if not p.is_folded]
-                if len(active_players) <= 1:
+                if self._active_count <= 1:
                     self.end_round()
                     return
 
-                active_not_allin = [p for p in active_players if not p.is_all_in]
-                acted_players = [p for p in active_not_allin if p.has_acted]
-                bets = {p.bet for p in active_not_allin}
-
-                if len(acted_players) == len(active_not_allin) and len(bets) <= 1:
+                if self._acted_count == self._active_not_allin_count and len(self._bet_counts) <= 1:
                     self.end_betting_round()
-                    return
+                    continue
 
                 current_player = self.players[self.current_player_index]
                 if current_player.is_folded or current_player.is_all_in:
                     self.current_player_index = (self.current_player_index + 1) % len(self.players)
+                    self._mark_state_changed()
                     continue
 
                 player_to_act = current_player
                 is_human = not player_to_act.is_cpu and not player_to_act.is_gemini
 
                 if is_human:
-                    self.log(f"あなたのターンです。")
                     self.human_action_needed = True
+                    self.log(f"あなたのターンです。")
                     return 
 
+                if player_to_act.is_gemini and player_to_act not in self._gemini_pending:
+                    self.request_gemini_actions()
+
             if not is_human and player_to_act:
                 if player_to_act.is_cpu:
                     self.get_cpu_action(player_to_act)
@@ -237,7 +579,7 @@ class PokerGame:
             self.human_action_needed = False
             self.handle_action(action, amount)
         
-        threading.Thread(target=self.process_turn, daemon=True).start()
+        self.action_event.set()
 
     def get_cpu_action(self, player):
         amount_to_call = self.current_bet - player.bet
@@ -250,54 +592,85 @@ class PokerGame:
         with self.action_lock:
             self.handle_action(action)
 
-    def get_gemini_poker_action(self, player):
-        # This runs in a separate thread and calls handle_action
-        hand_str = ' '.join(map(lambda c: c.suit + c.rank, player.hand))
-        community_str = ' '.join(map(lambda c: c.suit + c.rank, self.community_cards))
+    def request_gemini_actions(self):
+        # This method should only be called from within a locked context.
+        # Sends one concurrent batch for the current Gemini player and the
+        # Gemini players right after it that are certain to act this street.
+        batch = [self.players[self.current_player_index]]
+        for offset in range(1, len(self.players)):
+            p = self.players[(self.current_player_index + offset) % len(self.players)]
+            if p.is_folded or p.is_all_in:
+                continue
+            if not p.is_gemini or (p.has_acted and p.bet == self.current_bet):
+                break
+            batch.append(p)
+        state_key = self.gemini_state_key()
+        for p in batch:
+            self._gemini_pending[p] = (state_key, run_gemini(ask_gemini(self.gemini_prompt(p))))
+
+    def gemini_state_key(self):
+        # This method should only be called from within a locked context.
+        # A batched answer is reused only while this key is unchanged, so a
+        # raise, fold or all-in by an earlier seat makes the later seats ask
+        # again. A plain call or check by an earlier seat is accepted: it only
+        # moves that seat's own bet and chips in the prompt, while the pot
+        # (bets are collected at the end of the street) and the amount to call
+        # stay the same.
+        return (self.current_bet, self._active_count, self._active_not_allin_count)
+
+    def discard_gemini_actions(self):
+        # This method should only be called from within a locked context
+        for _, future in self._gemini_pending.values():
+            future.cancel()
+        self._gemini_pending.clear()
+
+    def gemini_prompt(self, player):
+        hand_str = ' '.join(map(str, player.hand))
+        community_str = ' '.join(map(str, self.community_cards))
         player_states = [p.to_dict() for p in self.players]
         amount_to_call = self.current_bet - player.bet
         min_raise = self.current_bet * 2 if self.current_bet > 0 else self.big_blind_amount
 
-        prompt = f"""
-            You are a professional Texas Hold'em poker player. Analyze the game state and output your best action in JSON format.
-            Game State:
-            - Stage: {self.game_stage}
-            - Your Hand: {hand_str}
-            - Community Cards: {community_str or "None"}
-            - Total Pot: {self.pot}
-            - Your current bet in this round: {player.bet}
-            - Amount to call: {amount_to_call}
-            - Your remaining chips: {player.chips}
-            - Player States: {json.dumps(player_states, indent=2)}
-            
-            Your possible actions:
-            - `fold`: Forfeit the round.
-            - `check`: Bet nothing (only if no call is required).
-            - `call`: Match the current bet.
-            - `raise`: Increase the bet. Specify the total amount in the `amount` field. Minimum raise to: {min_raise}.
-            - `all-in`: Bet all your remaining chips.
-
-            Output only the JSON object.
-            {{ "action": "...", "amount": ... }}
-            """
+        return f"""Game State:
+- Stage: {self.game_stage}
+- Your Hand: {hand_str}
+- Community Cards: {community_str or "None"}
+- Total Pot: {self.pot}
+- Your current bet in this round: {player.bet}
+- Amount to call: {amount_to_call}
+- Minimum raise to: {min_raise}
+- Your remaining chips: {player.chips}
+- Player States: {orjson.dumps(player_states).decode()}"""
+
+    def get_gemini_poker_action(self, player):
+        # Decisions from a batch are still applied one at a time, in turn order
+        future = None
         try:
             self.log(f"{player.name} (Gemini) is thinking...")
-            response = model.generate_content(prompt)
-            json_part = response.text[response.text.find('{'):response.text.rfind('}')+1]
-            action_data = json.loads(json_part)
-            action = action_data.get("action", "fold")
-            amount = action_data.get("amount", 0)
+            with self.action_lock:
+                asked_key, future = self._gemini_pending.pop(player, (None, None))
+                if future is None or asked_key != self.gemini_state_key():
+                    # The table changed after the batch was sent, so ask again
+                    if future:
+                        future.cancel()
+                    future = run_gemini(ask_gemini(self.gemini_prompt(player)))
+            # Every attempt plus the backoff, with a little slack
+            action, amount = future.result(timeout=GEMINI_TIMEOUT * (GEMINI_RETRIES + 1) + 2)
             self.log(f"Gemini's action: {action} {amount if action == 'raise' else ''}")
             with self.action_lock:
                 self.handle_action(action, amount)
         except Exception as e:
-            print(f"Gemini action error: {e}")
+            _LOG_Q.put_nowait(f"Gemini action error: {e!r}") # Console only
+            if future:
+                future.cancel()
             with self.action_lock:
-                self.handle_action("fold")
+                # Deterministic fallback: check when it costs nothing, otherwise fold
+                self.handle_action("check" if self.current_bet == player.bet else "fold")
 
     def handle_action(self, action, amount=0):
         # This method should only be called from within a locked context
         player = self.players[self.current_player_index]
+        self._untrack_betting_state(player)
         
         if action == 'fold':
             player.is_folded = True
@@ -334,18 +707,20 @@ class PokerGame:
             player.bet = amount
             self.current_bet = player.bet
             # Reset has_acted for other players
-            for p in self.players:
-                if p != player and not p.is_folded and not p.is_all_in:
-                    p.has_acted = False
+            self.acted[~(self.folded | self.all_in)] = False
+            self._acted_count = 0
         
         player.has_acted = True
+        self._track_betting_state(player)
         self.current_player_index = (self.current_player_index + 1) % len(self.players)
+        self._mark_state_changed()
 
     def end_betting_round(self):
         # This method should only be called from within a locked context
-        for p in self.players:
-            self.pot += p.bet
-            p.bet = 0
+        self.pot += int(self.bets.sum())
+        self.bets[:] = 0
+        self._mark_state_changed()
+        self.discard_gemini_actions()
         
         next_stage = {"pre-flop": "flop", "flop": "turn", "turn": "river", "river": "showdown"}
         self.game_stage = next_stage[self.game_stage]
@@ -363,39 +738,25 @@ class PokerGame:
             self.end_round()
             return
         
-        community_str = ' '.join(map(lambda c: c.suit + c.rank, self.community_cards))
+        community_str = ' '.join(map(str, self.community_cards))
         self.log(f"Community Cards: {community_str}")
-        self.process_betting_round()
-
-    def evaluate_hand(self, hand):
-        all_hands = list(itertools.combinations(hand, 5))
-        best_hand_rank = (-1, [])
-        for h in all_hands:
-            rank = self.get_hand_rank(h)
-            if rank[0] > best_hand_rank[0] or (rank[0] == best_hand_rank[0] and sorted([c.value for c in rank[1]], reverse=True) > sorted([c.value for c in best_hand_rank[1]], reverse=True)):
-                best_hand_rank = rank
-        return best_hand_rank
-
-    def get_hand_rank(self, hand):
-        hand = sorted(hand, key=lambda card: card.value, reverse=True)
-        values = [c.value for c in hand]; suits = [c.suit for c in hand]
-        is_flush = len(set(suits)) == 1
-        is_straight = (len(set(values)) == 5 and max(values) - min(values) == 4) or (values == [14, 5, 4, 3, 2])
-        if is_straight and is_flush: return (8, hand) if values != [14, 13, 12, 11, 10] else (9, hand)
-        counts = sorted({v: values.count(v) for v in set(values)}.items(), key=lambda item: (item[1], item[0]), reverse=True)
-        if counts[0][1] == 4: return (7, sorted(hand, key=lambda c: (c.value != counts[0][0], c.value), reverse=True))
-        if counts[0][1] == 3 and counts[1][1] == 2: return (6, hand)
-        if is_flush: return (5, hand)
-        if is_straight: return (4, [c for c in hand if c.value != 14] + [c for c in hand if c.value == 14]) if values == [14, 5, 4, 3, 2] else (4, hand)
-        if counts[0][1] == 3: return (3, sorted(hand, key=lambda c: (c.value != counts[0][0], c.value), reverse=True))
-        if counts[0][1] == 2 and counts[1][1] == 2: return (2, sorted(hand, key=lambda c: (c.value != counts[0][0] and c.value != counts[1][0], c.value), reverse=True))
-        if counts[0][1] == 2: return (1, sorted(hand, key=lambda c: (c.value != counts[0][0], c.value), reverse=True))
-        return (0, hand)
+        self.start_betting_round()
+
+    def evaluate_hands(self, hands):
+        # Best 5-of-7 score for each 7-card hand; lower is better (1 = royal flush)
+        codes = np.array([[c.code for c in hand] for hand in hands], dtype=np.uint32) # (N, 7)
+        combos = codes[:, COMBO_IDX] # (N, 21, 5)
+        is_flush = np.bitwise_and.reduce(combos, axis=-1) & 0xF000
+        flush_ranks = FLUSH_RANKS[np.bitwise_or.reduce(combos, axis=-1) >> 16]
+        prime_products = np.prod(combos & 0xFF, axis=-1, dtype=np.int64)
+        unsuited_ranks = UNSUITED_RANKS[np.searchsorted(UNSUITED_KEYS, prime_products)]
+        ranks = np.where(is_flush != 0, flush_ranks, unsuited_ranks)
+        return ranks.min(axis=1)
 
     def end_round(self):
         # This method should only be called from within a locked context
-        self.pot += sum(p.bet for p in self.players)
-        for p in self.players: p.bet = 0
+        self.pot += int(self.bets.sum())
+        self.bets[:] = 0
 
         active_players = [p for p in self.players if not p.is_folded]
         
@@ -407,16 +768,16 @@ class PokerGame:
             winner.chips += self.pot
             self.log(f"{winner.name} wins the pot ({self.pot})!")
         else:
-            winner_data = sorted([{"player": p, "rank": self.evaluate_hand(p.hand + self.community_cards)} for p in active_players], key=lambda x: (x["rank"][0], [c.value for c in x["rank"][1]]), reverse=True)
-            best_rank_tuple = (winner_data[0]["rank"][0], [c.value for c in winner_data[0]["rank"][1]])
-            winners = [d for d in winner_data if (d["rank"][0], [c.value for c in d["rank"][1]]) == best_rank_tuple]
+            ranks = self.evaluate_hands([p.hand + self.community_cards for p in active_players])
+            winner_data = [{"player": p, "rank": int(rank)} for p, rank in zip(active_players, ranks)]
+            best_rank = min(d["rank"] for d in winner_data)
+            winners = [d for d in winner_data if d["rank"] == best_rank]
             
             winnings = self.pot // len(winners)
             for w_data in winners:
                 w_data["player"].chips += winnings
             
-            hand_names = ["High Card", "One Pair", "Two Pair", "Three of a Kind", "Straight", "Flush", "Full House", "Four of a Kind", "Straight Flush", "Royal Flush"]
-            win_hand_name = hand_names[winner_data[0]["rank"][0]]
+            win_hand_name = HAND_NAMES[HAND_CATEGORIES[best_rank]]
             winner_names = ", ".join([w["player"].name for w in winners])
             
             self.log(f"{winner_names} win(s) the pot ({self.pot}) with {win_hand_name}!")
@@ -426,9 +787,27 @@ class PokerGame:
 
 # --- Flask App ---
 app = Flask(__name__)
-# Use a global variable for the game instance. 
-# For a real-world app, you'd manage sessions differently.
-game = None
+# Sessions only carry the game id; set FLASK_SECRET_KEY to keep them across restarts
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
+# One game per browser session, keyed by session['sid']
+GAMES = {}
+GAMES_LOCK = threading.Lock()
+GAME_IDLE_TTL = 30 * 60 # seconds without requests before a game is evicted
+
+def session_game():
+    game = GAMES.get(session.get('sid'))
+    if game:
+        game.last_active = time.monotonic()
+    return game
+
+def evict_idle_games():
+    # Stops abandoned games so their game threads exit
+    cutoff = time.monotonic() - GAME_IDLE_TTL
+    with GAMES_LOCK:
+        idle = [sid for sid, game in GAMES.items() if game.last_active < cutoff]
+        idle_games = [GAMES.pop(sid) for sid in idle]
+    for game in idle_games:
+        game.stop()
 
 @app.route('/')
 def index():
@@ -436,24 +815,53 @@ def index():
 
 @app.route('/start_game', methods=['POST'])
 def start_game_route():
-    global game
+    evict_idle_games()
     data = request.json
+    sid = session.setdefault('sid', uuid.uuid4().hex)
     game = PokerGame(
         human_player_name=data['name'],
         cpu_players=data['cpu_players'],
         gemini_players=data['gemini_players']
     )
+    with GAMES_LOCK:
+        old_game = GAMES.get(sid)
+        GAMES[sid] = game
+    if old_game:
+        old_game.stop()
     game.start_game_thread()
     return jsonify({"success": True})
 
 @app.route('/game_state')
 def game_state_route():
+    game = session_game()
+    if not game:
+        return jsonify({"error": "Game not started"}), 404
+    return Response(game.get_state_json(), mimetype='application/json')
+
+@app.route('/events')
+def events_route():
+    # Server-Sent Events: push the state whenever it changes instead of polling
+    game = session_game()
     if not game:
         return jsonify({"error": "Game not started"}), 404
-    return jsonify(game.get_state())
+    sid = session['sid']
+
+    def stream():
+        version = None
+        while GAMES.get(sid) is game:
+            new_version = game.wait_for_change(version, timeout=15)
+            game.last_active = time.monotonic() # An open stream keeps the game alive
+            if new_version == version:
+                yield ": keep-alive\n\n"
+                continue
+            version = new_version
+            yield b"data: " + game.get_state_json() + b"\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
 
 @app.route('/player_action', methods=['POST'])
 def player_action_route():
+    game = session_game()
     if not game or not game.human_action_needed:
         return jsonify({"error": "Not your turn or game not ready"}), 400
     data = request.json
@@ -464,10 +872,7 @@ def player_action_route():
 
 @app.route('/next_round', methods=['POST'])
 def next_round_route():
-    if not game or game.game_in_progress:
+    game = session_game()
+    if not game or not game.request_next_round():
         return jsonify({"error": "Cannot start next round now"}), 400
-    game.start_round() # Re-use start_round to begin the next hand
     return jsonify({"success": True})
-
-if __name__ == '__main__':
-    app.run(debug=True, port=5001)
@@ -14,7 +14,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     const nextRoundBtn = document.getElementById('next-round-btn');
 
-    let gameStateInterval = null;
+    let gameEvents = null;
 
     // --- Setup --- 
     startGameBtn.addEventListener('click', async () => {
@@ -44,25 +44,25 @@ document.addEventListener('DOMContentLoaded', () => {
         if (response.ok) {
             setupFrame.style.display = 'none';
             gameFrame.style.display = 'flex';
-            gameStateInterval = setInterval(fetchGameState, 1000); // 1秒ごとにゲーム状態を更新
+            subscribeGameState(); // 状態が変わるたびにサーバーから通知される
         } else {
             alert('ゲームの開始に失敗しました。');
         }
     });
 
     // --- Game Logic ---
-    async function fetchGameState() {
-        try {
-            const response = await fetch('/game_state');
-            if (!response.ok) {
-                throw new Error('Network response was not ok');
-            }
-            const state = await response.json();
-            updateUI(state);
-        } catch (error) {
-            console.error('Failed to fetch game state:', error);
-            clearInterval(gameStateInterval); // Stop polling on error
+    function subscribeGameState() {
+        if (gameEvents) {
+            gameEvents.close();
         }
+        gameEvents = new EventSource('/events');
+        gameEvents.onmessage = (event) => {
+            updateUI(JSON.parse(event.data));
+        };
+        gameEvents.onerror = (error) => {
+            // EventSource reconnects on its own
+            console.error('Game state stream error:', error);
+        };
     }
 
     function updateUI(state) {
@@ -191,7 +191,7 @@ document.addEventListener('DOMContentLoaded', () => {
     nextRoundBtn.addEventListener('click', async () => {
         nextRoundBtn.style.display = 'none';
         await fetch('/next_round', { method: 'POST' });
-        // The game state will be updated by the next poll
+        // The new game state is pushed over /events
     });
 
     async function sendPlayerAction(action, amount = 0) {
@@ -201,6 +201,6 @@ document.addEventListener('DOMContentLoaded', () => {
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify({ action, amount }),
         });
-        // The game state will be updated by the next poll
+        // The new game state is pushed over /events
     }
 });